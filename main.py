@@ -1,18 +1,67 @@
 import os
+import re
 import base64
+import asyncio
+import logging
+from types import MappingProxyType
 from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, EmailStr, TypeAdapter
 from datetime import datetime, timedelta, timezone
 
 from database import db, create_document, get_documents
-from schemas import Product, Order, OrderItem, Payment
+from schemas import Order, OrderItem, Payment
 
 from bson import ObjectId
-import requests
+from cachetools import TTLCache
+import httpx
 
-app = FastAPI(title="Vrijstad API")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Vrijstad API", default_response_class=ORJSONResponse)
+
+# Shared HTTP client for Midtrans; keeps TLS connections alive across requests
+client = httpx.AsyncClient(
+    base_url="https://app.sandbox.midtrans.com",
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=20.0,
+    headers={"Content-Type": "application/json"},
+)
+
+
+async def ensure_indexes():
+    # Missing indexes only cost query speed; never block or fail startup on them
+    try:
+        # Match the filter shapes used by list_products
+        await db["product"].create_index([("is_active", 1), ("category", 1), ("collection", 1)])
+        await db["product"].create_index([("is_active", 1), ("variants.size", 1)])
+        await db["product"].create_index([("name", "text"), ("description", "text"), ("tags", "text")])
+        # Webhook updates payments by order_id
+        await db["payment"].create_index("order_id")
+    except Exception as e:
+        logger.warning("Index creation failed: %s", str(e)[:200])
+
+
+_index_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def schedule_index_creation():
+    global _index_task
+    if db is not None:
+        # Run in the background so an unreachable server doesn't hold up boot
+        _index_task = asyncio.create_task(ensure_indexes())
+
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await client.aclose()
+
+# Read-through caches for catalog/journal listings, keyed on query params
+_products_cache: TTLCache = TTLCache(maxsize=1024, ttl=30)
+_posts_cache: TTLCache = TTLCache(maxsize=1, ttl=60)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,21 +74,20 @@ app.add_middleware(
 
 # Utilities
 
+_OID_RE = re.compile(r"[0-9a-fA-F]{24}")
+
+
 def oid(id_str: str) -> ObjectId:
-    try:
-        return ObjectId(id_str)
-    except Exception:
+    if not isinstance(id_str, str) or not _OID_RE.fullmatch(id_str):
         raise HTTPException(status_code=400, detail="Invalid ID format")
+    return ObjectId(id_str)
 
 
 def serialize(doc: Dict[str, Any]) -> Dict[str, Any]:
     if not doc:
         return doc
     doc["id"] = str(doc.pop("_id")) if doc.get("_id") else None
-    # Convert datetime fields
-    for k, v in list(doc.items()):
-        if isinstance(v, datetime):
-            doc[k] = v.isoformat()
+    # datetime fields are left as-is; ORJSONResponse encodes them natively
     return doc
 
 
@@ -49,7 +97,7 @@ def read_root():
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -62,7 +110,7 @@ def test_database():
         if db is not None:
             response["database"] = "✅ Available"
             response["connection_status"] = "Connected"
-            response["collections"] = db.list_collection_names()
+            response["collections"] = await db.list_collection_names()
             response["database"] = "✅ Connected & Working"
     except Exception as e:
         response["database"] = f"⚠️  Connected but Error: {str(e)[:80]}"
@@ -74,7 +122,7 @@ def test_database():
 # -------------------------------
 
 @app.get("/api/products")
-def list_products(
+async def list_products(
     q: Optional[str] = None,
     category: Optional[str] = None,
     size: Optional[str] = None,
@@ -87,13 +135,14 @@ def list_products(
     if limit < 1 or limit > 100:
         limit = 12
 
+    key = (q, category, size, collection, page, limit)
+    cached = _products_cache.get(key)
+    if cached is not None:
+        return cached
+
     filter_query: Dict[str, Any] = {"is_active": True}
     if q:
-        filter_query["$or"] = [
-            {"name": {"$regex": q, "$options": "i"}},
-            {"description": {"$regex": q, "$options": "i"}},
-            {"tags": {"$regex": q, "$options": "i"}},
-        ]
+        filter_query["$text"] = {"$search": q}
     if category:
         filter_query["category"] = category
     if collection:
@@ -101,17 +150,28 @@ def list_products(
     if size:
         filter_query["variants.size"] = size
 
-    total = db["product"].count_documents(filter_query)
-    cursor = (
-        db["product"].find(filter_query).skip((page - 1) * limit).limit(limit)
-    )
-    items = [serialize(doc) for doc in list(cursor)]
-    return {"items": items, "page": page, "limit": limit, "total": total}
+    # Single round-trip: evaluate the filter once, return the page and the count
+    pipeline = [
+        {"$match": filter_query},
+        {
+            "$facet": {
+                "items": [{"$skip": (page - 1) * limit}, {"$limit": limit}],
+                "total": [{"$count": "n"}],
+            }
+        },
+    ]
+    result = await db["product"].aggregate(pipeline).to_list(length=1)
+    facet = result[0] if result else {"items": [], "total": []}
+    total = facet["total"][0]["n"] if facet["total"] else 0
+    items = [serialize(doc) for doc in facet["items"]]
+    response = {"items": items, "page": page, "limit": limit, "total": total}
+    _products_cache[key] = response
+    return response
 
 
 @app.get("/api/products/{product_id}")
-def get_product(product_id: str):
-    doc = db["product"].find_one({"_id": oid(product_id)})
+async def get_product(product_id: str):
+    doc = await db["product"].find_one({"_id": oid(product_id)})
     if not doc:
         raise HTTPException(status_code=404, detail="Product not found")
     return serialize(doc)
@@ -122,61 +182,64 @@ class SeedRequest(BaseModel):
 
 
 @app.post("/api/seed")
-def seed_products(_: SeedRequest):
-    count = db["product"].count_documents({})
+async def seed_products(_: SeedRequest):
+    count = await db["product"].count_documents({})
     if count > 0:
         return {"message": "Already seeded", "count": count}
 
-    demo_products = [
-        Product(
-            name="Bandung Crest Tee",
-            description="Oversized tee with Vrijstad crest. 240gsm cotton.",
-            price=249000,
-            image="https://images.unsplash.com/photo-1542291026-7eec264c27ff?q=80&w=1600&auto=format&fit=crop",
-            category="tees",
-            collection="AW24",
-            variants=[
+    # Trusted literal data matching the Product schema; inserted without model round-trips
+    demo_products: List[Dict[str, Any]] = [
+        {
+            "name": "Bandung Crest Tee",
+            "description": "Oversized tee with Vrijstad crest. 240gsm cotton.",
+            "price": 249000.0,
+            "image": "https://images.unsplash.com/photo-1542291026-7eec264c27ff?q=80&w=1600&auto=format&fit=crop",
+            "category": "tees",
+            "collection": "AW24",
+            "variants": [
                 {"size": "S", "stock": 20},
                 {"size": "M", "stock": 20},
                 {"size": "L", "stock": 20},
                 {"size": "XL", "stock": 10},
             ],
-            tags=["crest", "oversized"],
-        ),
-        Product(
-            name="Freedom Hoodie",
-            description="Heavyweight hoodie with embroidery.",
-            price=549000,
-            image="https://images.unsplash.com/photo-1516826957135-700dedea698c?q=80&w=1600&auto=format&fit=crop",
-            category="hoodies",
-            collection="AW24",
-            variants=[
+            "tags": ["crest", "oversized"],
+        },
+        {
+            "name": "Freedom Hoodie",
+            "description": "Heavyweight hoodie with embroidery.",
+            "price": 549000.0,
+            "image": "https://images.unsplash.com/photo-1516826957135-700dedea698c?q=80&w=1600&auto=format&fit=crop",
+            "category": "hoodies",
+            "collection": "AW24",
+            "variants": [
                 {"size": "M", "stock": 15},
                 {"size": "L", "stock": 15},
                 {"size": "XL", "stock": 8},
             ],
-            tags=["hoodie", "embroidery"],
-        ),
-        Product(
-            name="Motion Cargo Pant",
-            description="Relaxed fit cargo with tapered leg.",
-            price=499000,
-            image="https://images.unsplash.com/photo-1519741497674-611481863552?q=80&w=1600&auto=format&fit=crop",
-            category="bottoms",
-            collection="Core",
-            variants=[
+            "tags": ["hoodie", "embroidery"],
+        },
+        {
+            "name": "Motion Cargo Pant",
+            "description": "Relaxed fit cargo with tapered leg.",
+            "price": 499000.0,
+            "image": "https://images.unsplash.com/photo-1519741497674-611481863552?q=80&w=1600&auto=format&fit=crop",
+            "category": "bottoms",
+            "collection": "Core",
+            "variants": [
                 {"size": "S", "stock": 10},
                 {"size": "M", "stock": 12},
                 {"size": "L", "stock": 10},
             ],
-            tags=["cargo", "street"],
-        ),
+            "tags": ["cargo", "street"],
+        },
     ]
 
-    ids = []
+    now = datetime.now(timezone.utc)
     for p in demo_products:
-        pid = create_document("product", p)
-        ids.append(pid)
+        p.update(is_active=True, created_at=now, updated_at=now)
+    result = await db["product"].insert_many(demo_products, ordered=False)
+    ids = [str(i) for i in result.inserted_ids]
+    _products_cache.clear()
 
     return {"message": "Seeded", "count": len(ids), "ids": ids}
 
@@ -199,13 +262,24 @@ class CheckoutRequest(BaseModel):
     items: List[CheckoutItem]
 
 
-def compute_totals(items: List[CheckoutItem]):
-    product_ids = [oid(i.product_id) for i in items]
+# Validates a whole cart in one pydantic-core call instead of one per line
+_ORDER_ITEM_LIST_ADAPTER = TypeAdapter(List[OrderItem])
+
+
+async def compute_totals(items: List[CheckoutItem]):
+    # Same product may appear on several cart lines (e.g. different sizes)
+    unique_ids = list(dict.fromkeys(i.product_id for i in items))
+    product_ids = [oid(x) for x in unique_ids]
     products_map: Dict[str, Dict[str, Any]] = {}
-    for doc in db["product"].find({"_id": {"$in": product_ids}}):
+    cursor = db["product"].find(
+        {"_id": {"$in": product_ids}},
+        projection={"price": 1, "name": 1, "image": 1},
+        batch_size=len(product_ids),
+    )
+    async for doc in cursor:
         products_map[str(doc["_id"]) ] = doc
 
-    order_items: List[OrderItem] = []
+    raw_items: List[Dict[str, Any]] = []
     total = 0.0
     for ci in items:
         doc = products_map.get(ci.product_id)
@@ -213,16 +287,17 @@ def compute_totals(items: List[CheckoutItem]):
             raise HTTPException(status_code=400, detail=f"Product {ci.product_id} not found")
         price = float(doc.get("price", 0))
         total += price * ci.quantity
-        order_items.append(
-            OrderItem(
-                product_id=ci.product_id,
-                name=doc.get("name"),
-                image=doc.get("image"),
-                size=ci.size,
-                quantity=ci.quantity,
-                price=price,
-            )
+        raw_items.append(
+            {
+                "product_id": ci.product_id,
+                "name": doc.get("name"),
+                "image": doc.get("image"),
+                "size": ci.size,
+                "quantity": ci.quantity,
+                "price": price,
+            }
         )
+    order_items = _ORDER_ITEM_LIST_ADAPTER.validate_python(raw_items)
     return order_items, total
 
 
@@ -234,9 +309,33 @@ def midtrans_auth_header() -> Dict[str, str]:
     return {"Authorization": f"Basic {token}", "Content-Type": "application/json"}
 
 
+# Server key is process-constant; build the auth headers once at import
+_MIDTRANS_HEADERS = midtrans_auth_header()
+
+# Map Midtrans status to our payment_status
+_STATUS_MAP = MappingProxyType({
+    "settlement": "paid",
+    "capture": "paid",
+    "pending": "pending",
+    "deny": "failed",
+    "cancel": "canceled",
+    "expire": "failed",
+    "failure": "failed",
+})
+
+
+async def create_snap_transaction(payload_mid: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+    try:
+        res = await client.post("/snap/v1/transactions", json=payload_mid, headers=headers)
+        return res.json()
+    except (httpx.HTTPError, ValueError):
+        # Continue without payment link in case of env not configured
+        return {}
+
+
 @app.post("/api/checkout")
-def create_order(payload: CheckoutRequest):
-    order_items, computed_total = compute_totals(payload.items)
+async def create_order(payload: CheckoutRequest, background_tasks: BackgroundTasks):
+    order_items, computed_total = await compute_totals(payload.items)
     order_doc = Order(
         user_name=payload.name,
         user_email=payload.email,
@@ -245,16 +344,17 @@ def create_order(payload: CheckoutRequest):
         items=order_items,
         total_amount=computed_total,
     )
-    order_id = create_document("order", order_doc)
+    # Mint the id up front so the insert and the Snap request can run concurrently
+    order_oid = ObjectId()
+    order_id = str(order_oid)
+    order_data = order_doc.model_dump()
+    order_data["_id"] = order_oid
+    insert_order = create_document("order", order_data)
 
     # Prepare Midtrans transaction (Snap)
-    headers = midtrans_auth_header()
-    snap_url = "https://app.sandbox.midtrans.com/snap/v1/transactions"
-
-    redirect_url = None
-    snap_token = None
-    transaction_id = None
+    headers = _MIDTRANS_HEADERS
 
+    data: Dict[str, Any] = {}
     if headers:
         item_details = [
             {
@@ -287,15 +387,13 @@ def create_order(payload: CheckoutRequest):
                 "duration": 24,
             },
         }
-        try:
-            res = requests.post(snap_url, json=payload_mid, headers=headers, timeout=20)
-            data = res.json()
-            snap_token = data.get("token")
-            redirect_url = data.get("redirect_url")
-            transaction_id = data.get("transaction_id") or data.get("token")
-        except Exception as e:
-            # Continue without payment link in case of env not configured
-            redirect_url = None
+        _, data = await asyncio.gather(insert_order, create_snap_transaction(payload_mid, headers))
+    else:
+        await insert_order
+
+    snap_token = data.get("token")
+    redirect_url = data.get("redirect_url")
+    transaction_id = data.get("transaction_id") or data.get("token")
 
     pay_doc = Payment(
         order_id=order_id,
@@ -303,7 +401,8 @@ def create_order(payload: CheckoutRequest):
         redirect_url=redirect_url,
         snap_token=snap_token,
     )
-    create_document("payment", pay_doc)
+    # Client doesn't need the payment id; write it after the response is sent
+    background_tasks.add_task(create_document, "payment", pay_doc)
 
     return {
         "order_id": order_id,
@@ -322,33 +421,33 @@ async def midtrans_webhook(request: Request):
     order_id = body.get("order_id")
     transaction_status = body.get("transaction_status")
 
-    # Map Midtrans status to our payment_status
-    status_map = {
-        "settlement": "paid",
-        "capture": "paid",
-        "pending": "pending",
-        "deny": "failed",
-        "cancel": "canceled",
-        "expire": "failed",
-        "failure": "failed",
-    }
-    new_status = status_map.get(transaction_status, "pending")
+    new_status = _STATUS_MAP.get(transaction_status, "pending")
 
     if order_id:
-        db["order"].update_one({"_id": oid(order_id)}, {"$set": {"payment_status": new_status, "updated_at": datetime.now(timezone.utc)}})
-        db["payment"].update_many({"order_id": order_id}, {"$set": {"status": transaction_status, "updated_at": datetime.now(timezone.utc)}})
+        now = datetime.now(timezone.utc)
+        await asyncio.gather(
+            db["order"].update_one({"_id": oid(order_id)}, {"$set": {"payment_status": new_status, "updated_at": now}}),
+            db["payment"].update_many({"order_id": order_id}, {"$set": {"status": transaction_status, "updated_at": now}}),
+        )
 
     return {"received": True}
 
 
 # Simple posts (journal) listing for MVP
 @app.get("/api/posts")
-def list_posts():
-    posts = [serialize(p) for p in db["post"].find({"published": True}).limit(20)]
-    return {"items": posts}
+async def list_posts():
+    cached = _posts_cache.get("published")
+    if cached is not None:
+        return cached
+    posts = [serialize(p) async for p in db["post"].find({"published": True}).limit(20)]
+    response = {"items": posts}
+    _posts_cache["published"] = response
+    return response
 
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    # loop/http default to "auto": uvloop and httptools are used when installed
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers)
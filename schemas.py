@@ -5,7 +5,7 @@ Each Pydantic model corresponds to a MongoDB collection (lowercased class name).
 Use these models for validation when creating or updating documents.
 """
 
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, ConfigDict, Field, EmailStr
 from typing import Optional, List, Literal
 from datetime import datetime
 
@@ -21,11 +21,15 @@ class User(BaseModel):
 
 
 class ProductVariant(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     size: Literal["XS", "S", "M", "L", "XL", "XXL"]
     stock: int = Field(0, ge=0, description="Stock for this size")
 
 
 class Product(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     name: str = Field(..., description="Product name")
     description: Optional[str] = Field(None, description="Product description")
     price: float = Field(..., ge=0, description="Price in IDR")
@@ -38,6 +42,8 @@ class Product(BaseModel):
 
 
 class OrderItem(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     product_id: str
     name: str
     image: Optional[str] = None
@@ -47,6 +53,8 @@ class OrderItem(BaseModel):
 
 
 class Order(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     user_name: str
     user_email: EmailStr
     address: str
@@ -58,6 +66,8 @@ class Order(BaseModel):
 
 
 class Payment(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     order_id: str
     provider: Literal["midtrans"] = "midtrans"
     transaction_id: Optional[str] = None